@@ -1,3 +1,3 @@
-from . import simulation, video
+from . import bitboard, simulation, simulation_cupy, simulation_numba, video
 
-__all__ = ["simulation", "video"]
+__all__ = ["bitboard", "simulation", "simulation_cupy", "simulation_numba", "video"]
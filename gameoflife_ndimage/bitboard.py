@@ -0,0 +1,160 @@
+"""
+Bit-packed ("bitboard") representation of 2D fields, storing 64 cells per uint64 word.
+
+Neighbour counting is done for all cells of a word at once via shifts and a bitwise adder network,
+so every numpy operation here touches 64x less memory than its per-cell counterpart.
+"""
+from typing import Iterable
+
+import numpy as np
+
+# Packed words are little-endian, so that bit k of word w is the cell in column 64*w + k.
+WORD_TYPE = np.dtype("<u8")
+WORD_BITS = 64
+
+# Modes of calculate_neighbours that the packed step supports.
+PACKED_MODES = ("wrap", "constant")
+
+_ONE = np.uint64(1)
+_TOP = np.uint64(WORD_BITS - 1)
+
+
+def pack_field(field: np.ndarray) -> np.ndarray:
+    """
+    Packs a 2D boolean field into words.
+
+    :param field: A 2D ndarray of booleans of shape (H, W).
+
+    :return: A 2D ndarray of shape (H, ceil(W/64)) of dtype WORD_TYPE. Bits beyond column W-1 are zero.
+    """
+    h, w = field.shape
+    n_words = -(-w // WORD_BITS)
+    padded = np.zeros((h, n_words * WORD_BITS), dtype=bool)
+    padded[:, :w] = field
+    return np.packbits(padded, axis=1, bitorder="little").view(WORD_TYPE)
+
+
+def unpack_field(words: np.ndarray, width: int) -> np.ndarray:
+    """
+    The inverse of pack_field.
+
+    :param words: Packed field as returned by pack_field.
+    :param width: Width of the original field.
+
+    :return: A 2D ndarray of booleans of shape (H, width).
+    """
+    words = np.ascontiguousarray(words, dtype=WORD_TYPE)
+    return np.unpackbits(words.view(np.uint8), axis=1, count=width, bitorder="little").astype(bool)
+
+
+def _shift_west(words: np.ndarray, width: int, wrap: bool) -> np.ndarray:
+    """Each cell takes the value of the cell to its left (column j-1)."""
+    res = words << _ONE
+    res[:, 1:] |= words[:, :-1] >> _TOP
+    if wrap:
+        last_word, last_bit = divmod(width - 1, WORD_BITS)
+        res[:, 0] |= (words[:, last_word] >> np.uint64(last_bit)) & _ONE
+    return res
+
+
+def _shift_east(words: np.ndarray, width: int, wrap: bool) -> np.ndarray:
+    """Each cell takes the value of the cell to its right (column j+1). Requires zeroed padding bits."""
+    res = words >> _ONE
+    res[:, :-1] |= words[:, 1:] << _TOP
+    if wrap:
+        last_word, last_bit = divmod(width - 1, WORD_BITS)
+        res[:, last_word] |= (words[:, 0] & _ONE) << np.uint64(last_bit)
+    return res
+
+
+def _shift_south(words: np.ndarray, wrap: bool) -> np.ndarray:
+    """Each row takes the value of the row above it (row i-1)."""
+    if wrap:
+        return np.roll(words, 1, axis=0)
+    res = np.zeros_like(words)
+    res[1:] = words[:-1]
+    return res
+
+
+def _shift_north(words: np.ndarray, wrap: bool) -> np.ndarray:
+    """Each row takes the value of the row below it (row i+1)."""
+    if wrap:
+        return np.roll(words, -1, axis=0)
+    res = np.zeros_like(words)
+    res[:-1] = words[1:]
+    return res
+
+
+def _full_add(a: np.ndarray, b: np.ndarray, c: np.ndarray):
+    """Bitwise full adder: returns (sum, carry)."""
+    a_xor_b = a ^ b
+    return a_xor_b ^ c, (a & b) | (c & a_xor_b)
+
+
+def count_bitplanes(words: np.ndarray, width: int, mode: str = "wrap"):
+    """
+    Counts the neighbours of every cell of a packed field.
+
+    :param words: Packed field as returned by pack_field.
+    :param width: Width of the unpacked field.
+    :param mode: One of PACKED_MODES, see calculate_neighbours.
+
+    :return: Four packed bitplanes (b0, b1, b2, b3), where the neighbour count of a cell is
+        b0 + 2*b1 + 4*b2 + 8*b3. Since the count is at most 8, b3 being set implies the other three aren't.
+    """
+    if mode not in PACKED_MODES:
+        raise ValueError("Unsupported mode for the packed step: {!r}".format(mode))
+    wrap = mode == "wrap"
+    west = _shift_west(words, width, wrap)
+    east = _shift_east(words, width, wrap)
+    row_n = (_shift_south(west, wrap), _shift_south(words, wrap), _shift_south(east, wrap))
+    row_s = (_shift_north(west, wrap), _shift_north(words, wrap), _shift_north(east, wrap))
+
+    # Adder network over the eight neighbour bitplanes: first the ones...
+    s1, c1 = _full_add(*row_n)
+    s2, c2 = _full_add(*row_s)
+    s3, c3 = west ^ east, west & east
+    b0, k1 = _full_add(s1, s2, s3)
+    # ...then the four carries of weight two...
+    t, k2 = _full_add(c1, c2, c3)
+    b1, k3 = t ^ k1, t & k1
+    # ...and finally the two carries of weight four.
+    return b0, b1, k2 ^ k3, k2 & k3
+
+
+def _count_mask(bitplanes, counts: Iterable[int]) -> np.ndarray:
+    """Packed mask of the cells whose neighbour count is one of counts."""
+    b0, b1, b2, b3 = bitplanes
+    res = np.zeros_like(b0)
+    for count in counts:
+        if count == 8:
+            res |= b3
+            continue
+        mask = ~b3
+        for bit, plane in zip((1, 2, 4), (b0, b1, b2)):
+            mask &= plane if count & bit else ~plane
+        res |= mask
+    return res
+
+
+def step_packed(
+    words: np.ndarray, width: int, survive: Iterable[int], come_to_live: Iterable[int], mode: str = "wrap"
+) -> np.ndarray:
+    """
+    Calculates the next state of a packed field.
+
+    :param words: Packed field as returned by pack_field.
+    :param width: Width of the unpacked field.
+    :param survive: Neighbour counts of a live cell that will cause it to stay alive.
+    :param come_to_live: Neighbour counts of a dead cell that will cause it to come alive.
+    :param mode: One of PACKED_MODES, see calculate_neighbours.
+
+    :return: The next state, packed.
+    """
+    bitplanes = count_bitplanes(words, width, mode)
+    new_words = (words & _count_mask(bitplanes, survive)) | (~words & _count_mask(bitplanes, come_to_live))
+    # Clear the padding bits of the last word, which the above may have set.
+    last_bits = width % WORD_BITS
+    if last_bits:
+        new_words[:, -1] &= np.uint64((1 << last_bits) - 1)
+    return new_words
@@ -1,17 +1,25 @@
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List, Tuple
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
 import numpy as np
 from PIL import Image
 from scipy.ndimage import correlate
 
+from . import bitboard, simulation_cupy, simulation_numba
 from .video import Recorder
 
 # The type to use for neighbour counting. For 2D and neasest neighbours only, a byte should be enough.
 COUNTER_TYPE = np.uint8
 # The neighbour-counting kernel
 neighbour_kernel = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]]).astype(COUNTER_TYPE)
+# Single-channel colors of dead and live cells, see State2D.to_gray_array
+GRAY_PALETTE = np.array([0, 255], dtype=np.uint8)
+# Number of indices to look up at a time, see _take_blocked
+TAKE_BLOCK_SIZE = 1 << 16
+# Modes for which calculate_neighbours uses a separable box sum instead of scipy.ndimage.correlate
+SEPARABLE_MODES = ("wrap", "constant")
 
 
 class Rules2D:
@@ -46,6 +54,29 @@ class Rules2D:
         self.come_to_live = np.array(sorted(come_to_live), dtype=COUNTER_TYPE)
         self.die = np.array(sorted(die), dtype=COUNTER_TYPE)
         self.mode = mode
+        # Lookup tables indexed by neighbour count: whether a live cell survives, and whether a dead one comes alive.
+        # These are what stepping uses, built once here - the steps never read come_to_live and die themselves.
+        self.survive = np.ones(9, dtype=bool)
+        self.survive[self.die] = False
+        self.birth = np.zeros(9, dtype=bool)
+        self.birth[self.come_to_live] = True
+        # Both tables interleaved, indexed by 2*count + alive - lets the step look its result up with one table.
+        self._transition = np.stack([self.birth, self.survive], axis=1).ravel()
+        # The tables are shared by every state using these rules, so they must not change.
+        for table in (self.survive, self.birth, self._transition):
+            table.setflags(write=False)
+        # Convay's rules can skip the tables entirely, see _step_field.
+        self._is_classic = self.come_to_live.tolist() == [3] and self.die.tolist() == [0, 1, 4, 5, 6, 7, 8]
+        # A copy of the transition table in GPU memory, made on first use by a field living there.
+        self._transition_cuda = None
+
+    def _transition_for(self, field) -> np.ndarray:
+        """The transition table, on the same device as field."""
+        if not simulation_cupy.is_cuda(field):
+            return self._transition
+        if self._transition_cuda is None:
+            self._transition_cuda = simulation_cupy.to_device(self._transition)
+        return self._transition_cuda
 
     @classmethod
     def classic(cls, mode: str = "wrap") -> "Rules2D":
@@ -71,75 +102,91 @@ class DrawParams:
             raise TypeError
         if self.resize_factor < 1:
             raise ValueError
-        alive = np.array(self.alive_color).reshape((3,))
-        dead = np.array(self.dead_color).reshape((3,))
-        for arr in (alive, dead):
-            if arr.dtype in (np.float32, np.float64) and arr.max() <= 1.0:
-                warnings.warn(
-                    "[DrawParams.__post_init__] Received an array of floating-point color with a max below 1. "
-                    "This will be interpreted as black - if you're using floating-point colors from "
-                    "0 to 1, rescale them to [0,255]."
-                )
-        self.alive_color = alive.astype(np.uint8)
-        self.dead_color = dead.astype(np.uint8)
+        self.alive_color = _to_color(self.alive_color)
+        self.dead_color = _to_color(self.dead_color)
+
+    @property
+    def _palette(self) -> np.ndarray:
+        """
+        The two colors, indexed by the cell state viewed as uint8. Built from the current colors on each use,
+        so changes to them after construction still apply.
+        """
+        return np.stack([_to_color(self.dead_color), _to_color(self.alive_color)])
+
+
+def _to_color(color: Iterable[int]) -> np.ndarray:
+    """Converts a color to an RGB array of dtype uint8, without copying if it already is one."""
+    arr = np.asarray(color)
+    if arr.dtype.kind == "f" and arr.max() <= 1.0:
+        warnings.warn(
+            "[DrawParams.__post_init__] Received an array of floating-point color with a max below 1. "
+            "This will be interpreted as black - if you're using floating-point colors from "
+            "0 to 1, rescale them to [0,255]."
+        )
+    return arr.astype(np.uint8, copy=False).reshape((3,))
 
 
 @dataclass
 class State2D:
-    # boolean 2d array
+    # boolean 2d array, C-contiguous
     field: np.ndarray
     rules: Rules2D
 
+    def __post_init__(self):
+        self.field = _contiguous_field(self.field)
+
     @property
     def wh(self) -> Tuple[int, int]:
         """Width and height"""
         return tuple(map(int, self.field.shape[:2][::-1]))  # type:ignore
 
+    @property
+    def device(self) -> str:
+        """The device the field lives on: "cuda" for GPU memory (see to_cuda), "cpu" otherwise."""
+        return "cuda" if simulation_cupy.is_cuda(self.field) else "cpu"
+
+    def to_cuda(self) -> "State2D":
+        """
+        Returns a copy of this state with the field in GPU memory, so that stepping runs there. Requires CuPy.
+        Drawing still happens on the CPU, copying the (boolean, so small) field back for each image.
+        """
+        return State2D(field=simulation_cupy.to_device(self.field), rules=self.rules)
+
+    def to_cpu(self) -> "State2D":
+        """Returns a copy of this state with the field in host memory. The inverse of to_cuda."""
+        return State2D(field=np.array(simulation_cupy.to_numpy(self.field)), rules=self.rules)
+
     def step(self) -> "State2D":
         """
         Calculates the next state. Does not alter self.
         """
-        neighbours = calculate_neighbours(self.field, self.rules.mode)
-        new_field = self.field.copy()
-
-        # Dead cells:
-        notfield = np.logical_not(self.field)
-        # Neighbours of alive cells:
-        live_neighbours = neighbours[self.field]
-        # Neighbours of dead cells:
-        dead_neighbours = neighbours[notfield]
+        new_field = np.empty_like(self.field, dtype=bool)
+        _step_field(self.field, self.rules, out=new_field)
+        return State2D(field=new_field, rules=self.rules)
 
-        # Live cells with the right neighbour counts die:
-        new_field[self.field] = np.logical_not(np.isin(live_neighbours, self.rules.die))
+    def to_image_array(self, draw_params: DrawParams, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        :param out: Optionally, a C-contiguous uint8 array of the shape of the image to write it into.
 
-        # Dead cells with the right neighbour counts come to life:
-        new_field[notfield] = np.isin(dead_neighbours, self.rules.come_to_live)
-        return State2D(field=new_field, rules=self.rules)
+        :return: The image as an array of shape (height, width, 3) - out, if it was provided.
+        """
+        return _draw_field(self.field, draw_params._palette, draw_params.resize_factor, out=out)
 
-    def _to_image_array_noresize(self, draw_params: DrawParams) -> np.ndarray:
-        """Utility method to convert to array without considering the resize factor"""
-        img_arr = np.full((*self.field.shape, 3), draw_params.dead_color, dtype=np.uint8)
-        img_arr[self.field] = draw_params.alive_color
-        return img_arr
+    def to_gray_array(self, draw_params: DrawParams, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Like to_image_array, but single-channel: 0 for dead cells and 255 for live ones, ignoring the colors.
+        Meant for recording with a Recorder that's been given a palette.
 
-    def to_image_array(self, draw_params: DrawParams) -> np.ndarray:
-        if draw_params.resize_factor == 1:
-            return self._to_image_array_noresize(draw_params)
-        return np.array(self.to_image(draw_params))  # type:ignore
+        :return: The image as an array of shape (height, width).
+        """
+        return _draw_field(self.field, GRAY_PALETTE, draw_params.resize_factor, out=out)
 
     def to_image(self, draw_params: DrawParams) -> "Image.Image":
-        unresized = self._to_image_array_noresize(draw_params=draw_params)
-        img = Image.fromarray(unresized)
-        if draw_params.resize_factor == 1:
-            return img
-        newsize = (img.size[0] * draw_params.resize_factor, img.size[1] * draw_params.resize_factor)
-        return img.resize(size=newsize, resample=Image.Resampling.NEAREST)
+        return Image.fromarray(self.to_image_array(draw_params))
 
     @classmethod
     def random(cls, rules: Rules2D, size: Tuple[int, int], seed: int | None = None) -> "State2D":
-        rng = np.random.default_rng(seed)
-        field = rng.integers(0, 2, size=size, dtype=bool)
-        return cls(field, rules)
+        return cls(_random_field(size, seed), rules)
 
     def run(self, ticks: int) -> Iterable["State2D"]:
         """
@@ -167,10 +214,34 @@ class State2D:
         """
         if ticks < 0:
             raise ValueError(ticks)
-        cur = self
-        for _ in range(ticks):
-            cur = cur.step()
-        return cur
+        if ticks == 0:
+            return self
+        if self.device == "cpu" and self.field.ndim == 2 and self.rules.mode in bitboard.PACKED_MODES:
+            # No intermediate states are needed, so it's worth packing the field.
+            width = self.field.shape[1]
+            survive = np.flatnonzero(self.rules.survive)
+            birth = np.flatnonzero(self.rules.birth)
+            words = bitboard.pack_field(self.field)
+            for _ in range(ticks):
+                words = bitboard.step_packed(words, width, survive, birth, self.rules.mode)
+            return State2D(field=bitboard.unpack_field(words, width), rules=self.rules)
+        for field in _iter_fields(self.field, self.rules, ticks):
+            pass
+        return State2D(field=field, rules=self.rules)
+
+    def _iter_frames(
+        self, ticks: int, draw_params: DrawParams, gray: bool = False
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yields (field, frame) for this and each following state, see _iter_fields. The frames are drawn as by
+        to_image_array, or by to_gray_array if gray is set, into two alternating buffers - so like the fields,
+        each frame gets overwritten two ticks later.
+        """
+        palette = GRAY_PALETTE if gray else draw_params._palette
+        frame_shape = (self.field.shape[0] * draw_params.resize_factor, self.field.shape[1] * draw_params.resize_factor)
+        frames = [np.empty(frame_shape + palette.shape[1:], dtype=np.uint8) for _ in range(2)]
+        for i, field in enumerate(_iter_fields(self.field, self.rules, ticks)):
+            yield field, _draw_field(field, palette, draw_params.resize_factor, out=frames[i % 2])
 
     def run_and_record(self, ticks: int, draw_params: DrawParams, recorder: Recorder) -> "State2D":
         """
@@ -185,23 +256,231 @@ class State2D:
 
         :return: The final state
         """
-        state = self
-        for state in self.run(ticks):
-            frame = state.to_image_array(draw_params)
-            recorder.send_frame(frame)
-        return state
+        # Encoding happens on a separate thread, so that the next state gets computed while ffmpeg ingests the
+        # current frame. Both the pipe write and numpy release the GIL. At most one frame is in flight at a time,
+        # so the frame buffer being sent is never the one being drawn into.
+        # With a gray recorder the colors are applied by ffmpeg, so only a byte per pixel has to go through the pipe.
+        frames = self._iter_frames(ticks, draw_params, gray=recorder.input_pixel_format == "gray")
+        with ThreadPoolExecutor(max_workers=1) as sender:
+            sending = None
+            for field, frame in frames:
+                if sending is not None:
+                    sending.result()
+                sending = sender.submit(recorder.send_frame, frame)
+            if sending is not None:
+                sending.result()
+        if ticks == 0:
+            return self
+        return State2D(field=field, rules=self.rules)
 
 
-def calculate_neighbours(field: np.ndarray, mode: str = "wrap") -> np.ndarray:
+@dataclass
+class BatchState2D:
+    """
+    A batch of independent 2D automata of the same size and rules, stepped together in single numpy calls
+    - cheaper than stepping each on its own when they're small, for example for sweeping initial conditions.
+    """
+
+    # boolean 3d array of shape (batch, height, width), C-contiguous. field[i] is the field of the i-th automaton.
+    field: np.ndarray
+    rules: Rules2D
+
+    def __post_init__(self):
+        self.field = _contiguous_field(self.field)
+        if self.field.ndim != 3:
+            raise ValueError("Expected a field of shape (batch, height, width)!")
+
+    def __len__(self) -> int:
+        return self.field.shape[0]
+
+    def __getitem__(self, i: int) -> State2D:
+        """The state of the i-th automaton. Its field is a view into this batch's."""
+        return State2D(field=self.field[i], rules=self.rules)
+
+    @classmethod
+    def from_states(cls, states: Iterable[State2D], rules: Rules2D) -> "BatchState2D":
+        return cls(np.stack([state.field for state in states]), rules)
+
+    @classmethod
+    def random(cls, rules: Rules2D, batch_size: int, size: Tuple[int, int], seed: int | None = None) -> "BatchState2D":
+        return cls(_random_field((batch_size, *size), seed), rules)
+
+    def step(self) -> "BatchState2D":
+        """
+        Calculates the next state of every automaton. Does not alter self.
+        """
+        new_field = np.empty_like(self.field, dtype=bool)
+        _step_field(self.field, self.rules, out=new_field)
+        return BatchState2D(field=new_field, rules=self.rules)
+
+    def after(self, ticks: int) -> "BatchState2D":
+        """
+        Run the automata from this state, returning the final state.
+
+        :param ticks: Ticks to simulate. Must be non-negative; zero does nothing and returns the current state.
+
+        :return: The final state.
+        """
+        if ticks < 0:
+            raise ValueError(ticks)
+        if ticks == 0:
+            return self
+        for field in _iter_fields(self.field, self.rules, ticks):
+            pass
+        return BatchState2D(field=field, rules=self.rules)
+
+
+def _contiguous_field(field):
+    """
+    The hot loops view fields as uint8 for integer arithmetic and SIMD-friendly ufunc loops,
+    which needs them to be C-contiguous booleans. This converts field if it isn't already.
+    """
+    if simulation_cupy.is_cuda(field):
+        return simulation_cupy.cupy().ascontiguousarray(field, dtype=bool)
+    return np.ascontiguousarray(field, dtype=bool)
+
+
+def _random_field(size: Tuple[int, ...], seed: int | None = None) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # Every random byte gives 8 cells.
+    n_cells = int(np.prod(size))
+    random_bytes = np.frombuffer(rng.bytes((n_cells + 7) // 8), dtype=np.uint8)
+    return np.unpackbits(random_bytes, count=n_cells).reshape(size).view(bool)
+
+
+def _iter_fields(field: np.ndarray, rules: Rules2D, ticks: int) -> Iterator[np.ndarray]:
+    """
+    Like State2D.run, but yields just the fields, stepping between two reused buffers instead of making a new State2D
+    (and new arrays) each tick. So each yielded field other than the first gets overwritten two ticks later -
+    only the last one can be kept.
+    """
+    yield field
+    buffers = [np.empty_like(field) for _ in range(min(ticks, 2))]
+    # The numba kernel counts the neighbours on the fly, so it doesn't need the buffer.
+    neighbours = np.empty_like(field, dtype=COUNTER_TYPE) if ticks > 0 and not _uses_numba(field, rules) else None
+    for i in range(ticks):
+        new_field = buffers[i % 2]
+        _step_field(field, rules, out=new_field, neighbours=neighbours)
+        field = new_field
+        yield field
+
+
+def _draw_field(field: np.ndarray, palette: np.ndarray, factor: int, out: np.ndarray | None = None) -> np.ndarray:
+    """Draws the field with the given palette (indexed by cell state), upscaled by factor"""
+    h, w = field.shape
+    cells = simulation_cupy.to_numpy(field).view(np.uint8)
+    if factor > 1:
+        # Nearest-neighbour upscaling is just repeating each cell, which a broadcast view does for free -
+        # the palette lookup then writes the whole upscaled frame in one pass.
+        cells = np.broadcast_to(cells[:, None, :, None], (h, factor, w, factor))
+    if out is None:
+        out = np.empty((h * factor, w * factor, *palette.shape[1:]), dtype=palette.dtype)
+    _take_blocked(palette, cells, out=out.reshape(cells.shape + palette.shape[1:]))
+    return out
+
+
+def _uses_numba(field: np.ndarray, rules: Rules2D) -> bool:
+    """Whether _step_field steps field with the numba kernel."""
+    return (
+        simulation_numba.AVAILABLE
+        and not simulation_cupy.is_cuda(field)
+        and field.ndim == 2
+        and rules.mode in simulation_numba.MODES
+    )
+
+
+def _step_field(field: np.ndarray, rules: Rules2D, out: np.ndarray, neighbours: np.ndarray | None = None) -> None:
+    """
+    Writes the state following field into out. If field has more than two dimensions, the leading ones are
+    batch dimensions - the cells are only adjacent along the last two.
+
+    :param neighbours: Optionally, a buffer of dtype COUNTER_TYPE and of the same shape as field, to count the
+        neighbours in. Its contents are overwritten.
+    """
+    if _uses_numba(field, rules):
+        simulation_numba.step2d(field, rules.survive, rules.birth, rules.mode, out)
+        return
+    neighbours = calculate_neighbours(field, rules.mode, out=neighbours, axes=(-2, -1))
+    if rules._is_classic:
+        # A cell is alive next tick iff it has 3 neighbours, or is alive and has 2 - that is, iff (count | alive) == 3.
+        np.bitwise_or(neighbours, field.view(np.uint8), out=neighbours)
+        np.equal(neighbours, 3, out=out)
+        return
+    # Turn the counts into indices into rules._transition in-place.
+    np.left_shift(neighbours, 1, out=neighbours)
+    np.bitwise_or(neighbours, field.view(np.uint8), out=neighbours)
+    table = rules._transition_for(field)
+    if simulation_cupy.is_cuda(field):
+        np.take(table, neighbours, out=out, mode="clip")
+    else:
+        _take_blocked(table, neighbours.reshape(-1), out=out.reshape(-1))
+
+
+def _take_blocked(table: np.ndarray, indices: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    np.take(table, indices, axis=0, out=out) for indices known to be in range, in blocks along the first axis of
+    indices. np.take converts the indices to intp, 8 bytes each - in blocks, that scratch copy stays small and in cache
+    instead of being several times the size of out. mode="clip" lets it write into out directly.
+    """
+    row_size = max(1, int(np.prod(indices.shape[1:])))
+    rows = max(1, TAKE_BLOCK_SIZE // row_size)
+    for start in range(0, len(indices), rows):
+        block = slice(start, start + rows)
+        np.take(table, indices[block], axis=0, out=out[block], mode="clip")
+    return out
+
+
+def calculate_neighbours(
+    field: np.ndarray, mode: str = "wrap", out: np.ndarray | None = None, axes: Sequence[int] | None = None
+) -> np.ndarray:
     """
     Returns the number of neighbours for each cell of the array.
 
     :param field: A n-d ndarray of booleans specifying the state of each cell
     :param mode: Mode to use for the correlation - usually either wrap or constant (with cval=False) depending on the topology.
+    :param out: Optionally, an array of the same shape and of dtype COUNTER_TYPE to write the counts into.
+    :param axes: The axes along which cells are adjacent - all of them by default. Cells differing in the index
+        along any other axis are never neighbours, which makes it possible to handle a batch of fields at once.
 
-    :return: A n-d ndarray of the same shape of dtype COUNTER_TYPE of the neighbour counts of each cell.
+    :return: A n-d ndarray of the same shape of dtype COUNTER_TYPE of the neighbour counts of each cell - out, if it
+        was provided.
     """
+    axes = range(field.ndim) if axes is None else sorted(axis % field.ndim for axis in axes)
+    if mode in SEPARABLE_MODES:
+        return _separable_neighbours(field, mode, axes, out=out)
     # TODO: Technically, not tested for n!=2.
-    res = np.zeros(field.shape, dtype=COUNTER_TYPE)
-    correlate(field, neighbour_kernel, output=res, mode=mode, cval=False)
+    # The kernel has a length of 1 along the other axes, so the cells along them don't interact whatever the mode.
+    kernel = neighbour_kernel.reshape([3 if axis in axes else 1 for axis in range(field.ndim)])
+    res = np.zeros_like(field, dtype=COUNTER_TYPE) if out is None else out
+    if simulation_cupy.is_cuda(field):
+        simulation_cupy.correlate(field.view(COUNTER_TYPE), kernel, output=res, mode=mode)
+        return res
+    # Same dtype for the input, the kernel and the output - bool and uint8 share the memory layout, so the view is free.
+    correlate(field.view(COUNTER_TYPE), kernel, output=res, mode=mode, cval=0)
     return res
+
+
+def _separable_neighbours(
+    field: np.ndarray, mode: str, axes: Iterable[int], out: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    The neighbour-counting kernel is a box of ones minus the centre, and the box is separable: summing each cell with
+    its two neighbours along every axis in turn gives the box sums in 2 additions per cell per axis,
+    instead of a 9-tap stencil.
+    """
+    centre = field.astype(COUNTER_TYPE)
+    counts = centre
+    for axis in axes:
+        if mode == "wrap":
+            counts = counts + np.roll(counts, 1, axis=axis) + np.roll(counts, -1, axis=axis)
+        else:
+            pad_width = [(1, 1) if i == axis else (0, 0) for i in range(field.ndim)]
+            padded = np.pad(counts, pad_width)
+            n = field.shape[axis]
+            counts = padded[_along(axis, 0, n)] + padded[_along(axis, 1, n + 1)] + padded[_along(axis, 2, n + 2)]
+    return np.subtract(counts, centre, out=out)
+
+
+def _along(axis: int, start: int, stop: int) -> tuple:
+    """An index selecting start:stop along the given axis, and everything along the preceding ones."""
+    return (slice(None),) * axis + (slice(start, stop),)
@@ -0,0 +1,42 @@
+"""
+Support for fields living in GPU memory, via CuPy.
+
+CuPy is an optional dependency, only imported once a state is moved to the GPU with State2D.to_cuda. Most of the
+simulation code works on such fields unchanged, since CuPy arrays dispatch numpy functions and ufuncs to their
+CUDA implementations - this module covers the rest.
+"""
+import numpy as np
+
+
+def cupy():
+    """Imports CuPy lazily."""
+    import cupy
+
+    return cupy
+
+
+def is_cuda(arr) -> bool:
+    """
+    Whether arr is a CuPy array. Checked without importing CuPy, so that anything else - numpy arrays, but also
+    nested lists and other array-likes - is treated as host data.
+    """
+    return type(arr).__module__.split(".")[0] == "cupy"
+
+
+def to_device(arr: np.ndarray):
+    """Copies a numpy array into GPU memory."""
+    return cupy().asarray(arr)
+
+
+def to_numpy(arr) -> np.ndarray:
+    """Copies a CuPy array back into host memory. numpy arrays are returned as-is."""
+    if not is_cuda(arr):
+        return arr
+    return arr.get()
+
+
+def correlate(field, kernel: np.ndarray, output, mode: str) -> None:
+    """The CuPy counterpart of scipy.ndimage.correlate, for the modes calculate_neighbours doesn't handle itself."""
+    from cupyx.scipy.ndimage import correlate as cupy_correlate
+
+    cupy_correlate(field, to_device(kernel), output=output, mode=mode, cval=0)
@@ -1,6 +1,6 @@
 import pathlib
 import warnings
-from typing import Optional, Tuple
+from typing import Iterable, Optional, Tuple
 
 import ffmpeg
 import numpy as np
@@ -19,6 +19,7 @@ class Recorder:
         ffmpeg_input_kwargs: Optional[dict] = None,
         ffmpeg_output_kwargs: Optional[dict] = None,
         supress_stdout: bool = True,
+        palette: Optional[Tuple[Iterable[int], Iterable[int]]] = None,
     ):
         """
 
@@ -31,29 +32,40 @@ class Recorder:
         :param ffmpeg_output_kwargs:
         :param supress_stdout: Whether the stdout of ffmpeg should be suppressed instead of being
             output into the console.
+        :param palette: Optionally, the (dead, alive) RGB colors to have ffmpeg draw a "gray" input with.
+            Frames are then expected to be single-channel, with 0 for dead cells and 255 for live ones, as given by
+            State2D.to_gray_array. This sends a third of the data of an "rgb24" input through the pipe.
         """
         # TODO: put some links to ffmpeg docs here
+        self.running = False
         if ffmpeg_input_kwargs is None:
             ffmpeg_input_kwargs = {}
         if ffmpeg_output_kwargs is None:
             ffmpeg_output_kwargs = {}
         if supress_stdout:
             ffmpeg_output_kwargs["loglevel"] = "quiet"
+        if palette is not None and input_pixel_format != "gray":
+            raise ValueError("A palette can only be used with the gray input pixel format!")
+        stream = ffmpeg.input(
+            "pipe:",
+            framerate=str(int(framerate)),
+            format="rawvideo",
+            pix_fmt=input_pixel_format,
+            s="{}x{}".format(*input_wh),
+            **ffmpeg_input_kwargs
+        )
+        if palette is not None:
+            dead, alive = (np.asarray(color, dtype=np.uint8).reshape((3,)) for color in palette)
+            channels = {channel: "if(gt(val,127),{},{})".format(alive[i], dead[i]) for i, channel in enumerate("rgb")}
+            stream = stream.filter("format", "rgb24").filter("lutrgb", **channels)
         process = (
-            ffmpeg.input(
-                "pipe:",
-                framerate=str(int(framerate)),
-                format="rawvideo",
-                pix_fmt=input_pixel_format,
-                s="{}x{}".format(*input_wh),
-                **ffmpeg_input_kwargs
-            )
-            .output(str(output_path), vcodec=output_vcodec, **ffmpeg_output_kwargs)
+            stream.output(str(output_path), vcodec=output_vcodec, **ffmpeg_output_kwargs)
             .overwrite_output()
             .run_async(pipe_stdin=True)
         )
         self.process = process
         self.wh = input_wh
+        self.input_pixel_format = input_pixel_format
         self.running = True
         self.output = pathlib.Path(output_path)
 
@@ -61,7 +73,9 @@ class Recorder:
         """Sends a frame to ffmpeg to be encoded."""
         if tuple(frame.shape[:2][::-1]) != self.wh:
             raise ValueError("The frame provided has wrong size!")
-        self.process.stdin.write(frame.tobytes())
+        # Hand the pipe the array's own buffer instead of a bytes copy of it.
+        frame = np.ascontiguousarray(frame)
+        self.process.stdin.write(memoryview(frame).cast("B"))
 
     def close(self):
         """Close the recorder and wait for the ffmpeg process to finish."""
@@ -1,6 +1,9 @@
 import numpy as np
+import pytest
+from scipy.ndimage import correlate
 
 import gameoflife_ndimage.simulation as sim
+import gameoflife_ndimage.simulation_numba as sim_numba
 
 
 def test_gol_64_zero_result():
@@ -80,3 +83,121 @@ def test_oscillator_blinker():
     _, s1, s2 = map(lambda x: x.field, state.run(2))
     assert s1.tolist() == state.field.T.tolist()  # rotates 90 degrees
     assert s2.tolist() == state.field.tolist()  # and returns to starting state
+
+
+def test_packed_after_matches_steps():
+    # Odd sizes, so that the wrapping has to cross partially-filled words.
+    for mode in ("wrap", "constant"):
+        rules = sim.Rules2D(come_to_live=[3, 6, 8], die=[0, 1, 4, 5, 7], mode=mode)
+        state = sim.State2D.random(rules, (37, 70), seed=1)
+        stepped = state
+        for _ in range(10):
+            stepped = stepped.step()
+        assert state.after(10).field.tolist() == stepped.field.tolist()
+
+
+def test_numba_step_matches_correlate():
+    pytest.importorskip("numba")
+    for mode in ("wrap", "constant"):
+        rules = sim.Rules2D(come_to_live=[2, 3], die=[0, 4, 5, 6, 7, 8], mode=mode)
+        for size in ((33, 47), (0, 5), (5, 0)):
+            state = sim.State2D.random(rules, size, seed=2)
+            out = np.empty_like(state.field)
+            sim_numba.step2d(state.field, rules.survive, rules.birth, mode, out)
+            neighbours = sim.calculate_neighbours(state.field, mode)
+            target = np.where(state.field, rules.survive[neighbours], rules.birth[neighbours])
+            assert out.shape == size
+            assert out.tolist() == target.tolist()
+            assert state.step().field.shape == size
+
+
+def test_separable_neighbours_match_correlate():
+    field = sim.State2D.random(sim.Rules2D.classic(), (19, 23), seed=3).field
+    for mode in sim.SEPARABLE_MODES:
+        target = np.zeros(field.shape, dtype=sim.COUNTER_TYPE)
+        correlate(field, sim.neighbour_kernel, output=target, mode=mode, cval=False)
+        assert sim.calculate_neighbours(field, mode).tolist() == target.tolist()
+
+
+def test_image_array_colors():
+    state = sim.State2D(np.array([[0, 1], [1, 1]], dtype=bool), sim.Rules2D.classic())
+    draw_params = sim.DrawParams(dead_color=[1, 2, 3], alive_color=[250, 251, 252])
+    img = state.to_image_array(draw_params)
+    assert img.dtype == np.uint8
+    assert img.tolist() == [[[1, 2, 3], [250, 251, 252]], [[250, 251, 252], [250, 251, 252]]]
+
+
+def test_image_array_resized():
+    state = sim.State2D.random(sim.Rules2D.classic(), (5, 7), seed=4)
+    draw_params = sim.DrawParams(dead_color=[0, 10, 20], alive_color=[200, 210, 220], resize_factor=3)
+    img = state.to_image_array(draw_params)
+    assert img.shape == (15, 21, 3)
+    unresized = state.to_image_array(sim.DrawParams(draw_params.dead_color, draw_params.alive_color))
+    assert img.tolist() == unresized.repeat(3, axis=0).repeat(3, axis=1).tolist()
+    assert np.array(state.to_image(draw_params)).tolist() == img.tolist()
+
+
+def test_numpy_step_matches_packed(monkeypatch):
+    monkeypatch.setattr(sim_numba, "AVAILABLE", False)
+    for mode in ("wrap", "constant"):
+        for rules in (sim.Rules2D(come_to_live=[1, 2, 5], die=[3, 4, 6], mode=mode), sim.Rules2D.classic(mode)):
+            state = sim.State2D.random(rules, (21, 18), seed=5)
+            assert state.step().step().field.tolist() == state.after(2).field.tolist()
+
+
+def test_field_normalized():
+    field = np.array([[0, 2, 0], [1, 0, 0]]).T
+    state = sim.State2D(field, sim.Rules2D.classic())
+    assert state.field.dtype == bool
+    assert state.field.flags.c_contiguous
+    assert state.field.tolist() == [[False, True], [True, False], [False, False]]
+    # Already in the right form, so not copied
+    assert sim.State2D(state.field, state.rules).field is state.field
+    from_list = sim.State2D([[0, 2, 0], [1, 0, 0]], sim.Rules2D.classic())
+    assert from_list.field.dtype == bool
+    assert from_list.field.flags.c_contiguous
+    assert from_list.field.tolist() == [[False, True, False], [True, False, False]]
+
+
+def test_batch_matches_individual():
+    for mode in ("wrap", "constant", "reflect"):
+        rules = sim.Rules2D(come_to_live=[3, 6], die=[0, 1, 4, 5, 7, 8], mode=mode)
+        batch = sim.BatchState2D.random(rules, 4, (13, 9), seed=7)
+        assert len(batch) == 4
+        stepped = batch.after(3)
+        for i in range(len(batch)):
+            target = batch[i].step().step().step()
+            assert stepped[i].field.tolist() == target.field.tolist()
+
+
+def test_rule_tables():
+    rules = sim.Rules2D(come_to_live=[3, 6], die=[0, 1, 4, 5, 7, 8])
+    assert rules.survive.tolist() == [False, False, True, True, False, False, True, False, False]
+    assert rules.birth.tolist() == [False, False, False, True, False, False, True, False, False]
+    with pytest.raises(ValueError):
+        rules.survive[0] = True
+
+
+def test_out_buffers():
+    state = sim.State2D.random(sim.Rules2D.classic(), (6, 9), seed=9)
+    for factor in (1, 3):
+        draw_params = sim.DrawParams(dead_color=[5, 6, 7], alive_color=[200, 201, 202], resize_factor=factor)
+        out = np.empty((6 * factor, 9 * factor, 3), dtype=np.uint8)
+        res = state.to_image_array(draw_params, out=out)
+        assert res is out
+        assert out.tolist() == state.to_image_array(draw_params).tolist()
+    for mode in ("wrap", "constant", "reflect"):
+        out = np.empty(state.field.shape, dtype=sim.COUNTER_TYPE)
+        res = sim.calculate_neighbours(state.field, mode, out=out)
+        assert res is out
+        assert out.tolist() == sim.calculate_neighbours(state.field, mode).tolist()
+
+
+def test_image_array_follows_color_changes():
+    state = sim.State2D(np.array([[0, 1]], dtype=bool), sim.Rules2D.classic())
+    alive = np.array([250, 251, 252], dtype=np.uint8)
+    draw_params = sim.DrawParams(dead_color=[1, 2, 3], alive_color=alive)
+    alive[0] = 7
+    assert state.to_image_array(draw_params).tolist() == [[[1, 2, 3], [7, 251, 252]]]
+    draw_params.dead_color = [9, 9, 9]
+    assert state.to_image_array(draw_params).tolist() == [[[9, 9, 9], [7, 251, 252]]]
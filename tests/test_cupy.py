@@ -0,0 +1,36 @@
+import sys
+
+import numpy as np
+import pytest
+
+import gameoflife_ndimage.simulation as sim
+
+
+def test_host_fields_dont_import_cupy(monkeypatch):
+    # Makes any attempt to import cupy raise ImportError.
+    monkeypatch.setitem(sys.modules, "cupy", None)
+    rules = sim.Rules2D.classic()
+    blinker = [[0] * 5, [0, 0, 1, 0, 0], [0, 0, 1, 0, 0], [0, 0, 1, 0, 0], [0] * 5]
+    for field in (blinker, np.array(blinker, dtype=bool)):
+        state = sim.State2D(field, rules)
+        assert state.device == "cpu"
+        assert state.field.dtype == bool
+        assert state.after(2).field.tolist() == state.field.tolist()
+        assert state.to_cpu().field.tolist() == state.field.tolist()
+        state.to_image_array(sim.DrawParams(dead_color=[0, 0, 0], alive_color=[255, 255, 255]))
+    batch = sim.BatchState2D([[[0, 1], [1, 0]]], rules)
+    assert batch.field.dtype == bool
+    batch.step()
+
+
+def test_cuda_matches_cpu():
+    pytest.importorskip("cupy")
+    for mode in ("wrap", "constant", "reflect"):
+        rules = sim.Rules2D(come_to_live=[3, 6], die=[0, 1, 4, 5, 7, 8], mode=mode)
+        state = sim.State2D.random(rules, (29, 31), seed=8)
+        on_gpu = state.to_cuda()
+        assert on_gpu.device == "cuda"
+        assert on_gpu.to_cpu().field.tolist() == state.field.tolist()
+        result = on_gpu.after(5).to_cpu()
+        assert result.device == "cpu"
+        assert result.field.tolist() == state.after(5).field.tolist()
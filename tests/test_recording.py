@@ -2,6 +2,9 @@ import os
 from pathlib import Path
 from tempfile import mkstemp
 
+import ffmpeg
+import numpy as np
+
 import gameoflife_ndimage.simulation as sim
 from gameoflife_ndimage.video import Recorder
 
@@ -43,3 +46,37 @@ def test_recording_basic():
             finally:
                 os.unlink(path)
     assert not path.exists()
+
+
+def test_recording_gray_palette():
+    rules = sim.Rules2D.classic()
+    draw_params = sim.DrawParams(dead_color=[0, 0, 160], alive_color=[255, 255, 0], resize_factor=2)
+    state = sim.State2D.random(rules, (64, 64), seed=6)
+    input_wh = tuple(a * draw_params.resize_factor for a in state.wh)
+
+    fd, path_str = mkstemp(suffix=".mp4")
+    os.close(fd)
+    path = Path(path_str)
+    try:
+        recorder = Recorder(
+            framerate=5,
+            input_wh=input_wh,
+            output_path=path,
+            input_pixel_format="gray",
+            palette=(draw_params.dead_color, draw_params.alive_color),
+        )
+        final = state.run_and_record(3, draw_params, recorder)
+        recorder.close()
+        assert final.field.tolist() == state.after(3).field.tolist()
+
+        out, _ = (
+            ffmpeg.input(str(path))
+            .output("pipe:", format="rawvideo", pix_fmt="rgb24", vframes=1, loglevel="quiet")
+            .run(capture_stdout=True)
+        )
+        first_frame = np.frombuffer(out, dtype=np.uint8).reshape((*input_wh[::-1], 3)).astype(int)
+        target = state.to_image_array(draw_params).astype(int)
+        # The encoding is lossy, so most pixels should be just close to the right color.
+        assert np.mean(np.abs(first_frame - target).max(axis=2) < 64) > 0.9
+    finally:
+        os.unlink(path)